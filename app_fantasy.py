@@ -2,9 +2,12 @@
 
 import os
 import sqlite3
+from contextlib import closing
+import numpy as np
 import pandas as pd
 import streamlit as st
-from unidecode import unidecode  # for cleaning names (accents mess up searching)
+
+from src.fantasy import fast_unidecode  # same name cleaning the pipeline uses
 
 DB_PATH = "nba.sqlite"  # keep relative so it works on Streamlit Cloud
 
@@ -16,66 +19,126 @@ st.markdown(
     unsafe_allow_html=True
 )
 
+# --- SQLite connection (bigger page cache + mmap so reads don't crawl) ---
+SQLITE_PRAGMAS = ("cache_size=-20000", "mmap_size=268435456", "temp_store=MEMORY")
+
+
+# Short-lived on purpose: a cached handle would keep reading a replaced (unlinked) DB file
+def open_db(db_file: str) -> sqlite3.Connection:
+    conn = sqlite3.connect(db_file, isolation_level=None)
+    for pragma in SQLITE_PRAGMAS:
+        conn.execute(f"PRAGMA {pragma}")
+    return conn
+
+
 # --- Load rankings from the local SQLite DB ---
-@st.cache_data
-def load_player_rankings(db_file: str) -> pd.DataFrame:
-    if not os.path.exists(db_file):
-        st.error(f"Can't find DB at '{db_file}'. Did you forget to add it?")
-        return pd.DataFrame()
+# Only pull the columns we actually render, typed by SQLite (no pandas coercion pass)
+RANKINGS_SQL = """
+    SELECT CAST(rank AS INTEGER) AS rank, full_name, position,
+           CAST(score AS REAL) AS score, CAST(games AS INTEGER) AS games,
+           CAST(mp AS REAL) AS mp, CAST(pts AS REAL) AS pts,
+           CAST(reb AS REAL) AS reb, CAST(ast AS REAL) AS ast,
+           CAST(stl AS REAL) AS stl, CAST(blk AS REAL) AS blk,
+           CAST(fg3m AS REAL) AS fg3m, CAST(fg_pct AS REAL) AS fg_pct,
+           CAST(ft_pct AS REAL) AS ft_pct, CAST(tov AS REAL) AS tov,
+           {display_name}
+    FROM fantasy_rankings
+    ORDER BY fantasy_rankings.score DESC
+"""
+
+# Nullable ints so a missing rank/GP doesn't blow up the whole load
+RANKINGS_DTYPES = {
+    "rank": "Int64", "games": "Int64",
+    "score": "float64", "mp": "float64", "pts": "float64", "reb": "float64",
+    "ast": "float64", "stl": "float64", "blk": "float64", "fg3m": "float64",
+    "fg_pct": "float64", "ft_pct": "float64", "tov": "float64",
+}
+
+
+def load_player_rankings(conn: sqlite3.Connection) -> tuple[pd.DataFrame, list[str], dict[str, np.ndarray]]:
+    cols = {row[1] for row in conn.execute("PRAGMA table_info(fantasy_rankings)")}
+    has_display = "display_name" in cols
+    sql = RANKINGS_SQL.format(display_name="display_name" if has_display else "NULL AS display_name")
+    df = pd.read_sql_query(sql, conn, dtype=RANKINGS_DTYPES)
+
+    # Accent-insensitive search/display (only for DBs built before fantasy.py stored it)
+    if not has_display:
+        df["display_name"] = [fast_unidecode(name) for name in df["full_name"].fillna("")]
+
+    # Categorical names so the "already picked" filter compares int codes, not strings
+    df["full_name"] = df["full_name"].astype("category")
+
+    # Only a handful of distinct positions — match them once, filter on category codes later
+    # (returned alongside the frame, not in df.attrs, which Streamlit tries to serialize)
+    df["position"] = df["position"].fillna("").astype("category")
+    cats = df["position"].cat.categories.str.lower()
+    pos_codes = {
+        choice: np.flatnonzero(cats.str.contains(choice.lower(), regex=False))
+        for choice in ("Guard", "Forward", "Center")
+    }
+
+    # Picker options, built once here instead of on every rerun
+    names = df["display_name"].dropna().unique().tolist()
 
+    return df, names, pos_codes
+
+
+def read_season_meta(conn: sqlite3.Connection) -> str | None:
+    # The ETL stores the season label in a tiny meta table — O(1) instead of a DISTINCT scan
     try:
-        conn = sqlite3.connect(db_file)
-        df = pd.read_sql("SELECT * FROM fantasy_rankings", conn)
-    except Exception as err:
-        st.error(f"Failed to read from the database: {err}")
-        return pd.DataFrame()
-    finally:
-        try:
-            conn.close()
-        except Exception:
-            pass
+        row = conn.execute("SELECT value FROM meta WHERE key = 'seasons'").fetchone()
+    except sqlite3.Error:
+        return None  # older DB without a meta table
+    return row[0] if row and row[0] else None
+
 
-    # Ensure essential columns exist
-    for col in ["full_name", "position"]:
-        if col not in df.columns:
-            df[col] = ""
+def scan_season_info(conn: sqlite3.Connection) -> str | None:
+    seasons = pd.read_sql("SELECT DISTINCT season FROM stats", conn)
+    vals = seasons["season"].dropna().unique().tolist()
+    return " / ".join(sorted(map(str, vals))) if vals else None
 
-    # Accent-insensitive search/display
-    df["display_name"] = df["full_name"].fillna("").apply(unidecode)
 
-    # Coerce numeric stats (SQLite can be loose with types)
-    stat_cols = [
-        "score", "pts", "reb", "ast", "stl", "blk", "fg3m",
-        "fg_pct", "ft_pct", "tov", "games", "mp", "rank"
-    ]
-    for stat in stat_cols:
-        if stat in df.columns:
-            df[stat] = pd.to_numeric(df[stat], errors="coerce")
+def find_season_info(conn: sqlite3.Connection) -> str:
+    # Fallback scan only for DBs the ETL wrote before it started filling meta
+    return read_season_meta(conn) or scan_season_info(conn) or "Unknown"
 
-    # Sort by best score first (if available)
-    if "score" in df.columns:
-        df = df.sort_values("score", ascending=False)
 
-    return df.reset_index(drop=True)
+def file_key(db_file: str) -> tuple[int, float]:
+    # inode catches a swapped-in file (os.replace / git pull), mtime an in-place rebuild
+    info = os.stat(db_file)
+    return info.st_ino, info.st_mtime
 
 
-@st.cache_data
-def find_season_info(db_file: str) -> str:
+# Rankings + picker names + position codes + season label in one cached call, over one short-lived connection.
+# `inode`/`mtime` are only there for the cache key — the load never writes, so the key is
+# stable and a rebuilt or replaced DB gets picked up once (max_entries keeps old DB
+# versions from piling up in memory).
+@st.cache_data(show_spinner=False, max_entries=4)
+def _load_cached(db_file: str, inode: int, mtime: float) -> tuple[pd.DataFrame, list[str], dict[str, np.ndarray], str]:
+    with closing(open_db(db_file)) as conn:
+        try:
+            df, names, pos_codes = load_player_rankings(conn)
+        except Exception as err:
+            st.error(f"Failed to read from the database: {err}")
+            return pd.DataFrame(), [], {}, "Unknown"
+
+        try:
+            season_label = find_season_info(conn)
+        except Exception:
+            season_label = "Unknown"
+
+    return df, names, pos_codes, season_label
+
+
+def load_all(db_file: str) -> tuple[pd.DataFrame, list[str], dict[str, np.ndarray], str]:
     if not os.path.exists(db_file):
-        return "Unknown"
-    try:
-        conn = sqlite3.connect(db_file)
-        seasons = pd.read_sql("SELECT DISTINCT season FROM stats", conn)
-        conn.close()
-        vals = seasons["season"].dropna().unique().tolist()
-        return " / ".join(sorted(map(str, vals))) if vals else "Unknown"
-    except Exception:
-        return "Unknown"
+        st.error(f"Can't find DB at '{db_file}'. Did you forget to add it?")
+        return pd.DataFrame(), [], {}, "Unknown"
+    return _load_cached(db_file, *file_key(db_file))
 
 
 # --- Data load ---
-rankings_df = load_player_rankings(DB_PATH)
-season_label = find_season_info(DB_PATH)
+rankings_df, searchable_names, pos_codes, season_label = load_all(DB_PATH)
 
 # Bail early so the page doesn't render half-broken
 if rankings_df.empty:
@@ -139,48 +202,42 @@ st.sidebar.markdown(
 pos_choice = st.sidebar.selectbox("Filter by position", ["All", "Guard", "Forward", "Center"])
 
 # Player picker – use cleaned names to search easily
-searchable_names = rankings_df["display_name"].dropna().unique().tolist()
 already_picked = st.sidebar.multiselect("Already Picked (search)", searchable_names)
 
-# Map back to actual names (for filtering)
-name_map = {unidecode(n): n for n in rankings_df["full_name"].dropna().unique()}
-picked_names = {name_map.get(name, name) for name in already_picked}
+# Map back to actual names (for filtering) — only bother once someone's been picked
+picked_names = set()
+if already_picked:
+    picked_names = set(rankings_df.loc[rankings_df["display_name"].isin(already_picked), "full_name"])
 
 top_n = st.sidebar.slider("Top N players to show", 10, 200, 50, step=10)
 
-# --- Apply filters ---
-filtered_df = rankings_df.copy()
+# --- Apply filters (one combined mask, one gather — no copy of the cached frame) ---
+columns_in_order = [
+    "rank", "full_name", "position", "score", "games", "mp",
+    "pts", "reb", "ast", "stl", "blk", "fg3m", "fg_pct", "ft_pct", "tov"
+]
+
+mask = np.ones(len(rankings_df), dtype=bool)
 
 if pos_choice != "All":
-    filtered_df["position"] = filtered_df["position"].fillna("").astype(str)
-    filtered_df = filtered_df[filtered_df["position"].str.contains(pos_choice, case=False, na=False)]
+    mask &= np.isin(rankings_df["position"].cat.codes.to_numpy(), pos_codes[pos_choice])
 
 if picked_names:
-    filtered_df = filtered_df[~filtered_df["full_name"].isin(picked_names)]
+    picked_codes = rankings_df["full_name"].cat.categories.get_indexer(list(picked_names))
+    picked_codes = picked_codes[picked_codes >= 0]  # -1 means unknown (and would match NaN names)
+    mask &= ~rankings_df["full_name"].cat.codes.isin(picked_codes).to_numpy()
 
-# --- Reorganize columns ---
-columns_in_order = [
-    "rank", "full_name", "position", "score", "games", "mp",
-    "pts", "reb", "ast", "stl", "blk", "fg3m", "fg_pct", "ft_pct", "tov"
-]
-for col in columns_in_order:
-    if col not in filtered_df.columns:
-        filtered_df[col] = pd.NA  # pad missing cols safely
+filtered_df = rankings_df.loc[mask, columns_in_order]
 
-display_table = filtered_df[columns_in_order].rename(columns={
+display_table = filtered_df.rename(columns={
     "rank": "Rank", "full_name": "Name", "position": "Position", "score": "Score",
     "games": "GP", "mp": "MP", "pts": "PTS", "reb": "REB", "ast": "AST",
     "stl": "STL", "blk": "BLK", "fg3m": "3PM", "fg_pct": "FG %",
     "ft_pct": "FT %", "tov": "TOV"
 })
 
-# Convert numerics for cleaner grid sorting
-for c in ["Rank","Score","GP","MP","PTS","REB","AST","STL","BLK","3PM","FG %","FT %","TOV"]:
-    if c in display_table.columns:
-        display_table[c] = pd.to_numeric(display_table[c], errors="coerce")
-
-# Slice top N
-top_players = display_table.head(top_n).reset_index(drop=True)
+# Slice top N (rows already come sorted from SQLite, and the grid hides the index)
+top_players = display_table.iloc[:top_n]
 
 # --- Output table ---
 st.subheader("Best Remaining Players")
@@ -188,10 +245,8 @@ st.subheader("Best Remaining Players")
 if top_players.empty:
     st.warning("Hmm, no data to display. Check filters or if the DB has the right stuff.")
 else:
-    # Formatting
-    for pcol in ["FG %", "FT %"]:
-        if pcol in top_players.columns:
-            top_players[pcol] = pd.to_numeric(top_players[pcol], errors="coerce") * 100
+    # Formatting (assign, since top_players is a slice of the filtered frame)
+    top_players = top_players.assign(**{pcol: top_players[pcol] * 100 for pcol in ["FG %", "FT %"]})
 
     # Ensure numeric types so sorting works correctly
     numeric_formats = {
@@ -210,12 +265,7 @@ else:
         "TOV":         "%.1f",
     }
 
-    # Coerce to numeric for all columns we’re formatting
-    for col in numeric_formats.keys():
-        if col in top_players.columns:
-            top_players[col] = pd.to_numeric(top_players[col], errors="coerce")
-
-    # Build Streamlit column config with formats
+    # Build Streamlit column config with formats (the grid formats cells in the browser)
     col_config = {}
     for col, fmt in numeric_formats.items():
         if col in top_players.columns:
@@ -1,11 +1,19 @@
 # src/etl.py — multi-pass, kinda-resilient ETL process for NBA stats
 import time
 import random
+import functools
+import threading
 import datetime as dt
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs, urlsplit
+import numpy as np
 import pandas as pd
-from sqlalchemy import create_engine
+import requests
+import requests_cache
+from sqlalchemy import create_engine, event
 
 # NBA API imports
+from nba_api.stats.library.http import NBAStatsHTTP
 from nba_api.stats.static import players as players_static
 from nba_api.stats.endpoints import (
     playergamelog,
@@ -17,11 +25,100 @@ from nba_api.stats.endpoints import (
 DB_URL = "sqlite:///nba.sqlite"
 engine = create_engine(DB_URL)
 
+@event.listens_for(engine, "connect")
+def _bulk_write_pragmas(dbapi_con, _record):
+    # Bulk loads only — no fsync per commit, rollback journal kept in memory
+    cur = dbapi_con.cursor()
+    cur.execute("PRAGMA synchronous=OFF")
+    cur.execute("PRAGMA journal_mode=MEMORY")
+    cur.close()
+
+# Rows per executemany batch — caps memory for the row tuples, not a speed knob
+WRITE_CHUNKSIZE = 10_000
+
+def write_table(df: pd.DataFrame, name: str, con, if_exists: str = "replace") -> None:
+    df.to_sql(name, con, if_exists=if_exists, index=False, chunksize=WRITE_CHUNKSIZE)
+
+# "Relevant" = enough games and minutes last season to matter for fantasy
+MIN_GP = 10
+MIN_MINUTES = 10.0
+
+# How many API calls we keep in flight at once (each worker still paces itself)
+FETCH_WORKERS = 6
+
+# ---------------- Rate Limiting ----------------
+
+class RateLimitGate:
+    # Shared across worker threads: once stats.nba.com starts throttling us, every
+    # call fast-fails for `cooldown` seconds instead of sleeping through doomed retries
+    def __init__(self, cooldown: float = 60.0, window: float = 30.0):
+        self.cooldown = cooldown
+        self.window = window  # timeouts this soon after a 429 count as throttling too
+        self._lock = threading.Lock()
+        self._blocked_until = 0.0
+        self._last_429 = float("-inf")
+
+    def _trip(self, now: float) -> None:
+        with self._lock:
+            self._blocked_until = max(self._blocked_until, now + self.cooldown)
+
+    def on_response(self, resp, *args, **kwargs):
+        # requests response hook — sees the status code nba_api never surfaces
+        if resp.status_code == 429:
+            now = time.monotonic()
+            self._last_429 = now
+            self._trip(now)
+
+    def on_error(self, err: Exception) -> None:
+        throttled_error = isinstance(err, (requests.exceptions.Timeout, requests.exceptions.ConnectionError))
+        now = time.monotonic()
+        if throttled_error and now - self._last_429 <= self.window:
+            self._trip(now)
+
+    def blocked(self) -> bool:
+        return time.monotonic() < self._blocked_until
+
+    def wait(self) -> None:
+        # Used between passes, so skipped players get retried once the cooldown is over
+        remaining = self._blocked_until - time.monotonic()
+        if remaining > 0:
+            print(f"Rate limited — waiting {remaining:.0f}s before the next pass …")
+            time.sleep(remaining)
+
+RATE_LIMIT = RateLimitGate()
+
+# On-disk cache for stats.nba.com responses — a finished season doesn't change,
+# so repeat runs get served from nba_api_cache.sqlite instead of the network
+HTTP_CACHE_NAME = "nba_api_cache"
+HTTP_CACHE_TTL = dt.timedelta(days=30)
+
+def is_cacheable(response) -> bool:
+    # Incremental game-log pulls (DateFrom=<last stored date>) repeat the same URL
+    # while new games keep landing — a cached copy would hide them for the whole TTL
+    return not parse_qs(urlsplit(response.url).query).get("DateFrom")
+
+def install_http_cache() -> requests_cache.CachedSession:
+    session = requests_cache.CachedSession(
+        HTTP_CACHE_NAME,
+        backend="sqlite",
+        expire_after=HTTP_CACHE_TTL,
+        allowable_methods=("GET", "POST"),
+        filter_fn=is_cacheable,
+    )
+    session.hooks["response"].append(RATE_LIMIT.on_response)
+    NBAStatsHTTP.set_session(session)
+    return session
+
+install_http_cache()
+
 # ---------------- Season Selection (find last full season) ----------------
 def get_last_completed_season(today: dt.date | None = None) -> str:
-    # fallback to today's date if none provided
-    today = today or dt.date.today()
+    # fallback to today's date if none provided (resolved per call, never cached)
+    return _season_for(today or dt.date.today())
 
+# Only explicit dates get memoized — caching the no-arg call would pin the first day's season
+@functools.lru_cache(maxsize=4)
+def _season_for(today: dt.date) -> str:
     # NBA season rolls over in July
     if today.month >= 7:
         start = today.year - 1
@@ -42,14 +139,25 @@ def sleep_a_bit(base=0.25, wiggle=0.25):
 def try_with_retries(fn, tries=4, wait=1.0, wait_max=6.0, jitter=0.4, fallback=None):
     delay = wait
     for attempt in range(1, tries + 1):
+        if RATE_LIMIT.blocked():
+            return fallback  # throttled — give up on this call, a later pass picks it up
         try:
             return fn()
         except Exception as e:
-            if attempt == tries:
+            RATE_LIMIT.on_error(e)
+            # nba_api's shared session keeps timing out once it's gone bad — swap in a fresh
+            # one (same on-disk cache) so the retry actually has a chance
+            install_http_cache()
+            if attempt == tries or RATE_LIMIT.blocked():
                 return fallback
             time.sleep(delay + random.random() * jitter)
             delay = min(wait_max, delay * 1.8)
 
+def _ids(values) -> np.ndarray:
+    # Player ids as int64 with junk/NaN dropped — one coerce, one mask
+    arr = pd.to_numeric(values, errors="coerce").to_numpy(dtype=np.float64)
+    return arr[~np.isnan(arr)].astype(np.int64)
+
 # ---------------- Player Info ----------------
 
 def get_active_players() -> pd.DataFrame:
@@ -65,48 +173,48 @@ def get_position_for_player(player_id: int) -> str:
         return str(df.loc[0, "POSITION"] or "")
     return try_with_retries(_fetch, fallback="") or ""
 
-# ---------------- Relevant Players Filter ----------------
+# ---------------- League Context (one call, shared) ----------------
 
-def find_relevant_players(season: str, min_gp=10, min_min=10.0) -> list[int]:
+def get_league_context(season: str) -> pd.DataFrame:
+    # League-wide per-game table — drives both the relevant-player filter and the safety sweep
     def _fetch():
         sleep_a_bit(0.2, 0.3)
-        resp = leaguedashplayerstats.LeagueDashPlayerStats(
+        return leaguedashplayerstats.LeagueDashPlayerStats(
             season=season,
             per_mode_detailed="PerGame",
             season_type_all_star="Regular Season",
             timeout=60,
-        )
-        return resp.get_data_frames()[0]
+        ).get_data_frames()[0]
 
     df = try_with_retries(_fetch, fallback=pd.DataFrame())
     if df.empty:
-        return []
+        return df
 
     df.columns = [c.upper() for c in df.columns]
-    df["GP"] = pd.to_numeric(df.get("GP", 0), errors="coerce").fillna(0)
-    df["MIN"] = pd.to_numeric(df.get("MIN", 0), errors="coerce").fillna(0)
+    for col in ["PLAYER_ID", "GP", "MIN", "PTS"]:
+        if col in df.columns:
+            df[col] = pd.to_numeric(df[col], errors="coerce")
 
-    mask = (df["GP"] >= min_gp) & (df["MIN"] >= min_min)
-    filtered = df.loc[mask]
-    return pd.to_numeric(filtered.get("PLAYER_ID", []), errors="coerce").dropna().astype(int).tolist()
+    return df
 
 # ---------------- Game Log per Player ----------------
 
-def fetch_gamelog_for_player(player_id: int, season: str) -> pd.DataFrame:
+def fetch_gamelog_for_player(
+    player_id: int, season: str, date_from: pd.Timestamp | None = None, tries: int = 4
+) -> pd.DataFrame:
+    # date_from is inclusive on the API side, so an up-to-date player still returns their last game
     def _fetch():
         sleep_a_bit(0.25, 0.35)
         gl = playergamelog.PlayerGameLog(
             player_id=player_id,
             season=season,
             season_type_all_star="Regular Season",
+            date_from_nullable=date_from.strftime("%m/%d/%Y") if date_from is not None else "",
             timeout=60,
         )
-        df = gl.get_data_frames()[0].copy()
-        if "PLAYER_ID" not in df.columns:
-            df["PLAYER_ID"] = player_id  # manually add if missing
-        return df
+        return gl.get_data_frames()[0]
 
-    df = try_with_retries(_fetch, fallback=None)
+    df = try_with_retries(_fetch, tries=tries, fallback=None)
     if df is None or df.empty:
         return pd.DataFrame()
 
@@ -124,50 +232,38 @@ def fetch_gamelog_for_player(player_id: int, season: str) -> pd.DataFrame:
         "FGM": "fgm", "FGA": "fga", "FTM": "ftm", "FTA": "fta",
     }
 
+    # Column selection already gives us a new frame, so no defensive copy of the raw one
     cols_to_keep = [c for c in renames if c in df.columns]
-    if "PLAYER_ID" not in cols_to_keep:
-        cols_to_keep = ["PLAYER_ID"] + cols_to_keep
-
-    df = df[cols_to_keep].rename(columns={k: renames[k] for k in cols_to_keep if k in renames})
+    df = df[cols_to_keep].rename(columns={k: renames[k] for k in cols_to_keep})
 
-    if "date" in df.columns:
-        df["date"] = pd.to_datetime(df["date"])
+    if "player_id" not in df.columns:
+        df.insert(0, "player_id", player_id)  # manually add if missing
 
     return df
 
-def gamelog_with_retries(player_id: int, season: str, tries: int = 3) -> pd.DataFrame:
-    for _ in range(tries):
-        df = fetch_gamelog_for_player(player_id, season)
-        if not df.empty:
-            return df
-        time.sleep(0.6 + random.random() * 0.8)
-    return pd.DataFrame()
+def fetch_gamelogs(player_ids, season: str, tries: int, since: dict | None = None) -> list[tuple[int, pd.DataFrame]]:
+    # Calls are I/O-bound, so a small thread pool hides most of the round-trip latency
+    since = since or {}
 
-# ---------------- Per-game Table ----------------
+    def _fetch_one(pid):
+        return pid, fetch_gamelog_for_player(pid, season, date_from=since.get(pid), tries=tries)
 
-def get_league_pergame(season: str) -> pd.DataFrame:
-    def _fetch():
-        sleep_a_bit(0.2, 0.3)
-        return leaguedashplayerstats.LeagueDashPlayerStats(
-            season=season,
-            per_mode_detailed="PerGame",
-            season_type_all_star="Regular Season",
-            timeout=60,
-        ).get_data_frames()[0]
-
-    df = try_with_retries(_fetch, fallback=pd.DataFrame())
-    if df.empty:
-        return df
-
-    df.columns = [c.upper() for c in df.columns]
-    for col in ["PLAYER_ID", "GP", "MIN", "PTS"]:
-        if col in df.columns:
-            df[col] = pd.to_numeric(df[col], errors="coerce")
+    with ThreadPoolExecutor(max_workers=FETCH_WORKERS) as ex:
+        return list(ex.map(_fetch_one, player_ids))
 
-    return df
+# ---------------- Stored Stats ----------------
 
-def make_games_table(df: pd.DataFrame) -> pd.DataFrame:
-    return df[["game_id", "date"]].drop_duplicates(subset=["game_id"]).reset_index(drop=True)
+def load_last_game_dates(season: str) -> dict[int, pd.Timestamp]:
+    # Latest stored game per player — empty on a fresh DB or when stats holds another season
+    try:
+        df = pd.read_sql(
+            "SELECT player_id, MAX(date) AS last_date FROM stats WHERE season = ? GROUP BY player_id",
+            engine,
+            params=(season,),
+        )
+    except Exception:
+        return {}
+    return dict(zip(df["player_id"].astype(int), pd.to_datetime(df["last_date"])))
 
 # ---------------- Main Process ----------------
 
@@ -183,33 +279,45 @@ def main():
     print("Pulling list of active players …")
     players = get_active_players()
 
-    print("Fetching positions (with retries)…")
-    players["position"] = players["player_id"].apply(get_position_for_player)
+    # Positions we already know come from the DB — only hit the API for the rest
+    cached_pos = dict(zip(prev_pos["player_id"], prev_pos["position"]))
+    players["position"] = players["player_id"].map(cached_pos).fillna("")
+    need_pos = players.loc[players["position"] == "", "player_id"].tolist()
 
-    if not prev_pos.empty:
-        players = players.merge(prev_pos, on="player_id", how="left", suffixes=("", "_old"))
-        players["position"] = players["position"].mask(players["position"] == "", players["position_old"])
-        players.drop(columns=["position_old"], inplace=True)
-
-    players["position"] = players["position"].fillna("")
-    players.to_sql("players", engine, if_exists="replace", index=False)
-    print(f"Saved player table with {len(players)} entries")
+    print(f"Fetching positions for {len(need_pos)} players (with retries)…")
+    if need_pos:
+        with ThreadPoolExecutor(max_workers=FETCH_WORKERS) as ex:
+            fetched_pos = dict(zip(need_pos, ex.map(get_position_for_player, need_pos)))
+        players["position"] = players["position"].mask(
+            players["position"] == "", players["player_id"].map(fetched_pos)
+        ).fillna("")
+    players["position"] = players["position"].astype("category")
 
     print(f"Filtering relevant players for {SEASON_STR} …")
-    relevant_ids = set(find_relevant_players(SEASON_STR))
+    RATE_LIMIT.wait()
+    league_df = get_league_context(SEASON_STR)
+    relevant_ids = set()
+    if not league_df.empty:
+        mask = (league_df["GP"].fillna(0) >= MIN_GP) & (league_df["MIN"].fillna(0) >= MIN_MINUTES)
+        relevant_ids = set(_ids(league_df.loc[mask, "PLAYER_ID"]))
     if not relevant_ids:
         print("No relevant players found — using all actives instead.")
         relevant_ids = set(players["player_id"].tolist())
 
-    target_ids = [pid for pid in players["player_id"] if pid in relevant_ids]
+    target_ids = players["player_id"][players["player_id"].isin(relevant_ids)]
     print(f"Targeting {len(target_ids)} players for logs …")
 
+    # Incremental mode: only ask for games after what's already in the DB
+    last_dates = load_last_game_dates(SEASON_STR)
+    incremental = bool(last_dates)
+    if incremental:
+        print(f"Found stored logs for {len(last_dates)} players — fetching new games only")
+
     # -------- PASS 1 --------
     gamelogs = []
     missed_first = []
 
-    for pid in target_ids:
-        df = gamelog_with_retries(pid, SEASON_STR, tries=2)
+    for pid, df in fetch_gamelogs(target_ids, SEASON_STR, tries=4, since=last_dates):
         if df.empty:
             missed_first.append(pid)
         else:
@@ -220,30 +328,27 @@ def main():
     # -------- PASS 2 --------
     if missed_first:
         print("Retrying missed players (second pass)…")
+        RATE_LIMIT.wait()
         recovered = 0
-        for pid in missed_first:
-            df = gamelog_with_retries(pid, SEASON_STR, tries=4)
+        for pid, df in fetch_gamelogs(missed_first, SEASON_STR, tries=6, since=last_dates):
             if not df.empty:
                 gamelogs.append(df)
                 recovered += 1
         print(f"Recovered {recovered} additional logs")
 
     # -------- Safety Sweep --------
-    fetched_ids = set()
-    for gdf in gamelogs:
-        if "player_id" in gdf.columns:
-            fetched_ids.update(pd.to_numeric(gdf["player_id"], errors="coerce").dropna().astype(int).tolist())
+    fetched = [_ids(gdf["player_id"]) for gdf in gamelogs if "player_id" in gdf.columns]
+    fetched_ids = pd.Index(np.concatenate(fetched) if fetched else [], dtype=np.int64)
+    still_missing = players["player_id"][~players["player_id"].isin(fetched_ids)]
 
-    still_missing = [pid for pid in players["player_id"] if pid not in fetched_ids]
-
-    if still_missing:
-        table = get_league_pergame(SEASON_STR)
-        if not table.empty:
-            extras = table[table["PLAYER_ID"].isin(still_missing)].copy()
+    if not still_missing.empty:
+        if not league_df.empty:
+            extras = league_df[league_df["PLAYER_ID"].isin(still_missing)].copy()
             if not extras.empty:
                 extras = extras.sort_values(["MIN", "PTS", "GP"], ascending=[False, False, False])
-                for pid in extras["PLAYER_ID"].astype(int).head(150).tolist():
-                    df = gamelog_with_retries(pid, SEASON_STR, tries=3)
+                sweep_ids = extras["PLAYER_ID"].astype(int).head(150).tolist()
+                RATE_LIMIT.wait()
+                for pid, df in fetch_gamelogs(sweep_ids, SEASON_STR, tries=4, since=last_dates):
                     if not df.empty:
                         gamelogs.append(df)
 
@@ -251,16 +356,40 @@ def main():
     if not gamelogs:
         raise RuntimeError("No data collected — something’s off with the API or season logic")
 
+    # One concat, then parse dates once for the whole frame (not once per player)
     stats_df = pd.concat(gamelogs, ignore_index=True)
-    stats_df["season"] = SEASON_STR
-    stats_df.to_sql("stats", engine, if_exists="replace", index=False)
-
-    games_df = make_games_table(stats_df)
-    games_df.to_sql("games", engine, if_exists="replace", index=False)
+    stats_df["date"] = pd.to_datetime(stats_df["date"], format="%b %d, %Y")
+    # Low-cardinality text columns as categoricals (SQLite still just sees TEXT)
+    stats_df["season"] = pd.Series(SEASON_STR, index=stats_df.index, dtype="category")
+    if "team" in stats_df.columns:
+        stats_df["team"] = stats_df["team"].astype("category")
+
+    if incremental:
+        # Drop the overlap (each player's last stored game comes back again)
+        last_seen = stats_df["player_id"].map(last_dates)
+        stats_df = stats_df[last_seen.isna() | (stats_df["date"] > last_seen)]
+
+    # All writes share one transaction — one journal flush instead of one per table
+    with engine.begin() as con:
+        write_table(players, "players", con)
+        print(f"Saved player table with {len(players)} entries")
+
+        write_table(stats_df, "stats", con, if_exists="append" if incremental else "replace")
+        con.exec_driver_sql("CREATE UNIQUE INDEX IF NOT EXISTS idx_stats_player_game ON stats(player_id, game_id)")
+
+        # Season label for the app (saves it a DISTINCT scan over stats)
+        con.exec_driver_sql("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        con.exec_driver_sql("INSERT OR REPLACE INTO meta (key, value) VALUES ('seasons', ?)", (SEASON_STR,))
+
+        # Rebuilt inside SQLite from the whole stats table (earlier runs included)
+        con.exec_driver_sql("DROP TABLE IF EXISTS games")
+        con.exec_driver_sql("CREATE TABLE games AS SELECT game_id, MIN(date) AS date FROM stats GROUP BY game_id")
+        n_games = con.exec_driver_sql("SELECT COUNT(*) FROM games").scalar()
 
     # Log unresolved
-    fetched_ids = set(pd.to_numeric(stats_df["player_id"], errors="coerce").dropna().astype(int).tolist())
-    missing_ids = [pid for pid in target_ids if pid not in fetched_ids]
+    stored_ids = pd.read_sql("SELECT DISTINCT player_id FROM stats", engine)["player_id"]
+    fetched_ids = pd.Index(_ids(stored_ids))
+    missing_ids = target_ids[~target_ids.isin(fetched_ids)].tolist()
 
     if missing_ids:
         import csv
@@ -270,7 +399,7 @@ def main():
             writer.writerows([[pid] for pid in missing_ids])
         print(f"Saved list of {len(missing_ids)} missing player IDs to etl_missing_ids.csv")
 
-    print(f"Saved {len(stats_df)} rows across {len(games_df)} games")
+    print(f"Saved {len(stats_df)} new rows ({n_games} games in DB)")
     print("All done — DB: nba.sqlite")
 
 if __name__ == "__main__":
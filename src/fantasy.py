@@ -2,6 +2,7 @@
 import sqlite3
 import numpy as np
 import pandas as pd
+from unidecode import unidecode  # for cleaning names (accents mess up searching)
 
 # Database file — should already exist from the ETL phase
 DB_PATH = "nba.sqlite"
@@ -17,54 +18,69 @@ DEFAULT_WEIGHTS["tov"] = -1.0
 MIN_GAMES = 10
 MIN_MINUTES = 10.0
 
+# Most names are plain ASCII, and the accented ones mostly use a small set of letters.
+# Translate those in C via str.translate and only hand the odd leftovers to unidecode.
+_ACCENTS = "áàâäãåéèêëíìîïóòôöõøúùûüñçğşćčšžłýÁÀÂÄÃÅÉÈÊËÍÌÎÏÓÒÔÖÕØÚÙÛÜÑÇĞŞĆČŠŽŁÝ"
+_ACCENT_TABLE = str.maketrans({ch: unidecode(ch) for ch in _ACCENTS})
 
-def _parse_minutes(min_str):
-    """Convert 'mm:ss' style minutes to float, or pass through if numeric."""
-    if isinstance(min_str, (int, float)):
-        return float(min_str)
-    if isinstance(min_str, str) and ":" in min_str:
-        mins, secs = min_str.split(":", 1)
-        if mins.isdigit() and secs.isdigit():
-            return int(mins) + int(secs) / 60.0
-    return np.nan  # fallback if format is weird
+
+def fast_unidecode(name: str) -> str:
+    if name.isascii():
+        return name
+    cleaned = name.translate(_ACCENT_TABLE)
+    return cleaned if cleaned.isascii() else unidecode(name)
+
+
+def _parse_minutes(min_col: pd.Series) -> pd.Series:
+    """Convert 'mm:ss' style minutes to float, or pass through if numeric (vectorized)."""
+    num = pd.to_numeric(min_col, errors="coerce")  # plain int/float rows
+    is_str = num.isna() & min_col.notna()
+    if not is_str.any():
+        return num.astype(float)
+
+    parts = min_col.where(is_str).astype(str).str.split(":", n=1, expand=True).reindex(columns=[0, 1])
+    mins = pd.to_numeric(parts[0], errors="coerce")
+    secs = pd.to_numeric(parts[1], errors="coerce")
+    return num.fillna(mins + secs / 60.0)  # NaN if format is weird
 
 
 def load_tables():
-    # Load from local SQLite DB
+    # Load from local SQLite DB (raw sqlite3 + read_sql_query — no SQLAlchemy layer in between)
     con = sqlite3.connect(DB_PATH)
     try:
-        stats = pd.read_sql("""
-            SELECT player_id, game_id, date, pts, ast, reb, stl, blk,
-                   fg3m, fg_pct, ft_pct, tov, min
+        # Typed + projected in SQL ('date' isn't used by the rankings, so it stays in the DB)
+        stats = pd.read_sql_query("""
+            SELECT CAST(player_id AS INTEGER) AS player_id,
+                   CAST(game_id AS INTEGER) AS game_id,
+                   CAST(pts AS REAL) AS pts, CAST(ast AS REAL) AS ast,
+                   CAST(reb AS REAL) AS reb, CAST(stl AS REAL) AS stl,
+                   CAST(blk AS REAL) AS blk, CAST(fg3m AS REAL) AS fg3m,
+                   CAST(fg_pct AS REAL) AS fg_pct, CAST(ft_pct AS REAL) AS ft_pct,
+                   CAST(tov AS REAL) AS tov, min
             FROM stats
         """, con)
 
-        players = pd.read_sql("""
+        players = pd.read_sql_query("""
             SELECT player_id, full_name, position
             FROM players
         """, con)
     finally:
         con.close()
 
-    stats["mp"] = stats["min"].apply(_parse_minutes)
+    stats["mp"] = _parse_minutes(stats["min"]).astype("float32")
+
+    # Narrow dtypes — halves the memory traffic of the groupby / z-score passes.
+    # SQLite already did the type conversion, so this is a plain cast, no coercion.
+    stats = stats.astype({"player_id": "int32", "game_id": "int32", **{cat: "float32" for cat in CATEGORIES}})
     return stats, players
 
 
 def per_game(stats_df: pd.DataFrame) -> pd.DataFrame:
     # Compute per-game averages (only for players with decent minutes)
-    agg = stats_df.groupby("player_id").agg(
-        games=("game_id", "nunique"),
-        mp=("mp", "mean"),
-        pts=("pts", "mean"),
-        reb=("reb", "mean"),
-        ast=("ast", "mean"),
-        stl=("stl", "mean"),
-        blk=("blk", "mean"),
-        fg3m=("fg3m", "mean"),
-        fg_pct=("fg_pct", "mean"),
-        ft_pct=("ft_pct", "mean"),
-        tov=("tov", "mean"),
-    ).reset_index()
+    g = stats_df.groupby("player_id", sort=False)
+    agg = g[["mp"] + CATEGORIES].mean()
+    agg.insert(0, "games", g["game_id"].nunique())
+    agg = agg.reset_index()
 
     # Filter out the fringe guys
     filtered = agg[(agg["games"] >= MIN_GAMES) & (agg["mp"] >= MIN_MINUTES)].copy()
@@ -72,22 +88,22 @@ def per_game(stats_df: pd.DataFrame) -> pd.DataFrame:
 
 
 def zscore_rank(df: pd.DataFrame, cats=CATEGORIES, weights=DEFAULT_WEIGHTS) -> pd.DataFrame:
-    # Compute z-scores per category, handle NaNs and zero stddev cases
+    # Compute z-scores for all categories at once as a (players x cats) matrix
     df = df.copy()
-    for cat in cats:
-        vals = pd.to_numeric(df[cat], errors="coerce")
-        mean = vals.mean(skipna=True)
-        std = vals.std(skipna=True)
+    X = df[cats].to_numpy(dtype=np.float64)
+    mu = np.nanmean(X, axis=0)
+    sd = np.nanstd(X, axis=0, ddof=1)
 
-        if std is None or std == 0 or np.isnan(std):
-            df[f"{cat}_z"] = 0.0
-        else:
-            df[f"{cat}_z"] = (vals - mean) / std
+    # Zero/undefined stddev -> that category contributes nothing (z = 0)
+    flat = ~(sd > 0)
+    sd[flat] = 1.0
+    Z = (X - mu) / sd
+    Z[:, flat] = 0.0
+    df[[f"{cat}_z" for cat in cats]] = Z
 
     # Weighted total score
-    df["score"] = 0.0
-    for cat in cats:
-        df["score"] += weights.get(cat, 1.0) * df[f"{cat}_z"].fillna(0)
+    w = np.array([weights.get(cat, 1.0) for cat in cats])
+    df["score"] = np.nan_to_num(Z) @ w
 
     # Adjust by how many games they played (soft bonus for availability)
     max_gp = df["games"].max()
@@ -105,12 +121,19 @@ def build_rankings():
     ranked_df = ranked_df.merge(players_df, on="player_id", how="left")
 
     # Assign ranks (dense so no gaps in case of ties)
-    ranked_df["rank"] = ranked_df["score"].rank(method="dense", ascending=False).astype(int)
+    _, inv = np.unique(-ranked_df["score"].to_numpy(), return_inverse=True)
+    ranked_df["rank"] = (inv.ravel() + 1).astype(np.int32)
     ranked_df = ranked_df.sort_values(["rank", "full_name"]).reset_index(drop=True)
 
+    # Accent-free names for the app's search box, so it can just SELECT them
+    ranked_df["display_name"] = [fast_unidecode(name) for name in ranked_df["full_name"].fillna("")]
+
     con = sqlite3.connect(DB_PATH)
     try:
         ranked_df.to_sql("fantasy_rankings", con, if_exists="replace", index=False)
+        # Lets the app's ORDER BY score DESC read rows pre-sorted (replace drops it, so rebuild here)
+        con.execute("CREATE INDEX IF NOT EXISTS idx_fantasy_score ON fantasy_rankings(score DESC)")
+        con.commit()
     finally:
         con.close()
 